@@ -3,39 +3,83 @@
 Server for interfacing with .eth domains to query .well-known/atproto-did files.
 """
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
 import httpx
+import orjson
+import asyncio
 import re
 import os
+import time
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import boto3
-from botocore.exceptions import ClientError
-from typing import Dict, Any, Optional
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from typing import Dict, Any, List, Optional, Tuple, Union
 from dotenv import load_dotenv
-from io import BytesIO
-import tempfile
-import shutil
+from urllib.parse import quote
 import content_hash
+import requests
+from requests.adapters import HTTPAdapter
 from web3 import Web3
+from web3.exceptions import Web3Exception, Web3RPCError
+from eth_hash.auto import keccak
+from eth_abi import encode as abi_encode, decode as abi_decode
+from eth_abi.exceptions import DecodingError
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="ETH Domain ATProto DID Server")
+app = FastAPI(title="ETH Domain ATProto DID Server", default_response_class=ORJSONResponse)
 
-# Configure CORS to allow requests from anywhere
+# Configure CORS to allow requests from anywhere by default, or from a
+# comma-separated list of origins in CORS_ALLOW_ORIGINS.
+# Browsers may cache preflight responses for a day, so a POST doesn't need an OPTIONS round trip each time.
+CORS_ALLOW_ORIGINS = [origin.strip() for origin in os.getenv('CORS_ALLOW_ORIGINS', '*').split(',') if origin.strip()]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CORS_ALLOW_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
+    max_age=86400,
 )
 
-# DID validation regex - basic check for did:method:identifier format
-DID_PATTERN = re.compile(r'^did:[a-z0-9]+:[a-zA-Z0-9._:%-]+$')
+# Compress larger responses (batch results, long error messages); single
+# lookups are mostly below the threshold and go out as-is
+app.add_middleware(GZipMiddleware, minimum_size=256)
+
+# DID validation regex - basic check for did:method:identifier format.
+# Used with fullmatch; re.ASCII keeps the character classes off the Unicode tables.
+# Quantifiers are bounded so the engine can give up early on oversized input.
+DID_PATTERN = re.compile(r'did:[a-z0-9]{1,32}:[a-zA-Z0-9._:%-]{1,2048}', re.ASCII)
+# Same pattern for raw gateway bodies, so they can be checked before decoding
+DID_PATTERN_BYTES = re.compile(rb'did:[a-z0-9]{1,32}:[a-zA-Z0-9._:%-]{1,2048}')
+# Shortest possible DID is "did:a:b"; anything past 2 KiB is not a DID we accept
+MIN_DID_LENGTH = 7
+MAX_DID_LENGTH = 2048
+# Gateway responses beyond this size are rejected without being read in full
+MAX_DID_FILE_SIZE = 4096
+
+# ENS domain validation regex - lowercase DNS-style labels under .eth, as used
+# for atproto handles. Used with fullmatch so malformed input never reaches a gateway URL.
+ENS_DOMAIN_PATTERN = re.compile(
+    r'[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?)*\.eth',
+    re.ASCII
+)
+MAX_DOMAIN_LENGTH = 253
+
+# Pre-serialized bodies for error responses whose content never changes,
+# in the same {"detail": ...} shape FastAPI uses for HTTPException
+INVALID_DOMAIN_BODY = orjson.dumps({"detail": "Domain must be a valid .eth name"})
+DOMAIN_MISMATCH_BODY = orjson.dumps({"detail": "Domain in request body must match path parameter"})
 
 # Filebase configuration
 FILEBASE_ACCESS_KEY = os.getenv('FILEBASE_ACCESS_KEY')
@@ -44,61 +88,89 @@ FILEBASE_BUCKET = os.getenv('FILEBASE_BUCKET', 'atproto-did')
 FILEBASE_ENDPOINT = os.getenv('FILEBASE_ENDPOINT', 'https://s3.filebase.com')
 FILEBASE_IPFS_RPC = os.getenv('FILEBASE_IPFS_RPC', 'https://ipfs.filebase.io')
 FILEBASE_IPFS_RPC_KEY = os.getenv('FILEBASE_IPFS_RPC_KEY')  # Optional IPFS RPC API key
+# Size of the S3 connection pool; botocore's default of 10 starves concurrent uploads
+FILEBASE_MAX_CONNECTIONS = int(os.getenv('FILEBASE_MAX_CONNECTIONS', '50'))
 
 # Sepolia testing mode - use test server instead of .eth.link gateway
 TEST_SERVER_URL = os.getenv('TEST_SERVER_URL')  # e.g., "http://localhost:3000"
 SEPOLIA_TEST_MODE = os.getenv('SEPOLIA_TEST_MODE', 'false').lower() == 'true'
 
+# Optional Redis for a lookup cache shared by all workers, e.g. "redis://localhost:6379/0"
+REDIS_URL = os.getenv('REDIS_URL')
+
 # Ethereum RPC configuration for ENS Registry queries
 ETH_RPC_URL = os.getenv('ETH_RPC_URL')  # e.g., a mainnet endpoint like https://ethereum-rpc.publicnode.com
+ETH_RPC_TIMEOUT = float(os.getenv('ETH_RPC_TIMEOUT', '3'))  # seconds, per eth_call
+# Size of the RPC connection pool; requests' default of 10 makes concurrent checks reconnect
+ETH_RPC_MAX_CONNECTIONS = int(os.getenv('ETH_RPC_MAX_CONNECTIONS', '32'))
 # ENS Registry contract address (same on Mainnet and Sepolia)
 ENS_REGISTRY_ADDRESS = '0x00000000000C2E074eC69A0dFb2997BA6C7d2e1e'
-# ENS Registry ABI - need owner() and resolver() functions
-ENS_REGISTRY_ABI = [
-    {
-        "constant": True,
-        "inputs": [{"name": "node", "type": "bytes32"}],
-        "name": "owner",
-        "outputs": [{"name": "", "type": "address"}],
-        "type": "function"
-    },
-    {
-        "constant": True,
-        "inputs": [{"name": "node", "type": "bytes32"}],
-        "name": "resolver",
-        "outputs": [{"name": "", "type": "address"}],
-        "type": "function"
-    }
-]
-# ENS Resolver ABI - need contenthash() function
-ENS_RESOLVER_ABI = [
-    {
-        "constant": True,
-        "inputs": [{"name": "node", "type": "bytes32"}],
-        "name": "contenthash",
-        "outputs": [{"name": "", "type": "bytes"}],
-        "type": "function"
-    }
-]
+# Multicall3 (same address on Mainnet and Sepolia), used to read owner() and
+# resolver() from the registry in a single eth_call
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+# Function selectors for the calls made. Calldata is built by hand rather than
+# through web3 contract objects, which re-walk the ABI on every call; each
+# ENS function takes a single bytes32 node, so its calldata is selector + node.
+ENS_OWNER_SELECTOR = keccak(b'owner(bytes32)')[:4]
+ENS_RESOLVER_SELECTOR = keccak(b'resolver(bytes32)')[:4]
+ENS_CONTENTHASH_SELECTOR = keccak(b'contenthash(bytes32)')[:4]
+MULTICALL3_AGGREGATE3_SELECTOR = keccak(b'aggregate3((address,bool,bytes)[])')[:4]
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+# What an ENS eth_call can fail with: an RPC or revert error from web3, a
+# transport error or timeout from requests, a reply body that isn't JSON
+# (json.JSONDecodeError is a ValueError), or return data that doesn't decode
+ENS_CALL_ERRORS = (Web3Exception, requests.RequestException, ValueError, DecodingError)
 
 # Initialize Web3 if RPC URL is provided
 web3_instance = None
-ens_registry_contract = None
 if ETH_RPC_URL:
     try:
-        web3_instance = Web3(Web3.HTTPProvider(ETH_RPC_URL))
-        if web3_instance.is_connected():
-            ens_registry_contract = web3_instance.eth.contract(
-                address=Web3.to_checksum_address(ENS_REGISTRY_ADDRESS),
-                abi=ENS_REGISTRY_ABI
-            )
-        else:
+        # ENS checks run in worker threads, so size the provider's connection
+        # pool to match and keep TLS connections to the RPC endpoint open
+        rpc_session = requests.Session()
+        rpc_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ETH_RPC_MAX_CONNECTIONS, max_retries=0)
+        rpc_session.mount('https://', rpc_adapter)
+        rpc_session.mount('http://', rpc_adapter)
+        # Fail fast instead of using web3's default retries and long read
+        # timeout; a failed check just reports the ENS status as unknown
+        web3_instance = Web3(Web3.HTTPProvider(
+            ETH_RPC_URL,
+            request_kwargs={'timeout': ETH_RPC_TIMEOUT},
+            session=rpc_session,
+            exception_retry_configuration=None
+        ))
+        if not web3_instance.is_connected():
             print(f"Warning: Failed to connect to Ethereum RPC at {ETH_RPC_URL}")
             web3_instance = None
     except Exception as e:
         print(f"Warning: Failed to initialize Web3: {e}")
         web3_instance = None
-        ens_registry_contract = None
+
+# Shared outbound HTTP client, created on startup so gateway lookups reuse
+# pooled keep-alive connections instead of paying a TCP+TLS handshake each time.
+# HTTP/2 lets concurrent lookups to the same gateway multiplex over one connection.
+GATEWAY_TIMEOUT = httpx.Timeout(10.0, connect=5.0, pool=None)
+GATEWAY_LIMITS = httpx.Limits(max_keepalive_connections=100, max_connections=1000, keepalive_expiry=60.0)
+# Cap on concurrent gateway requests across all callers, so bursts queue here
+# instead of piling onto the gateway until it starts timing out
+GATEWAY_MAX_CONCURRENCY = int(os.getenv('GATEWAY_MAX_CONCURRENCY', '32'))
+gateway_semaphore = asyncio.Semaphore(GATEWAY_MAX_CONCURRENCY)
+# https://<domain>.link/.well-known/atproto-did/, parsed once; lookups swap in the host
+GATEWAY_URL_TEMPLATE = httpx.URL("https://eth.link/.well-known/atproto-did/")
+# How long a lookup may wait for a free slot before it's answered as a
+# gateway failure, so an overloaded server sheds load instead of queueing forever
+GATEWAY_QUEUE_TIMEOUT = float(os.getenv('GATEWAY_QUEUE_TIMEOUT', '5'))
+
+
+@app.on_event("startup")
+async def create_http_client():
+    app.state.http_client = httpx.AsyncClient(timeout=GATEWAY_TIMEOUT, limits=GATEWAY_LIMITS, http2=True)
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await app.state.http_client.aclose()
+
 
 # Initialize Filebase S3 client
 if FILEBASE_ACCESS_KEY and FILEBASE_SECRET_KEY:
@@ -106,18 +178,70 @@ if FILEBASE_ACCESS_KEY and FILEBASE_SECRET_KEY:
         's3',
         endpoint_url=FILEBASE_ENDPOINT,
         aws_access_key_id=FILEBASE_ACCESS_KEY,
-        aws_secret_access_key=FILEBASE_SECRET_KEY
+        aws_secret_access_key=FILEBASE_SECRET_KEY,
+        config=Config(
+            max_pool_connections=FILEBASE_MAX_CONNECTIONS,
+            retries={'max_attempts': 5, 'mode': 'adaptive'},
+            tcp_keepalive=True,
+            connect_timeout=5,
+            read_timeout=30
+        )
     )
 else:
     s3_client = None
 
 
+# Initialize Redis client if configured (connects lazily on first use)
+if REDIS_URL:
+    redis_client = Redis.from_url(REDIS_URL)
+else:
+    redis_client = None
+
+
+@app.on_event("shutdown")
+async def close_redis_client():
+    if redis_client:
+        await redis_client.aclose()
+
+
+# Dedicated thread pool for blocking boto3 calls, sized to the S3 connection
+# pool so uploads neither starve nor are starved by asyncio's default executor
+@app.on_event("startup")
+async def create_s3_executor():
+    app.state.s3_executor = ThreadPoolExecutor(
+        max_workers=FILEBASE_MAX_CONNECTIONS,
+        thread_name_prefix='s3'
+    )
+
+
+@app.on_event("shutdown")
+async def close_s3_executor():
+    app.state.s3_executor.shutdown(wait=True)
+
+
 def is_valid_did(did: str) -> bool:
     """Check if a string is a syntactically valid DID."""
     if not did:
         return False
     did = did.strip()
-    return bool(DID_PATTERN.match(did))
+    # Cheap length and prefix checks reject most garbage before the regex runs
+    if len(did) < MIN_DID_LENGTH or len(did) > MAX_DID_LENGTH or not did.startswith('did:'):
+        return False
+    return DID_PATTERN.fullmatch(did) is not None
+
+
+def is_valid_ens_domain(domain: str) -> bool:
+    """Check if a string is a well-formed .eth domain."""
+    if not domain or len(domain) > MAX_DOMAIN_LENGTH:
+        return False
+    return ENS_DOMAIN_PATTERN.fullmatch(domain) is not None
+
+
+def is_valid_did_bytes(did: bytes) -> bool:
+    """Check if already-stripped raw bytes are a syntactically valid DID."""
+    if len(did) < MIN_DID_LENGTH or len(did) > MAX_DID_LENGTH or not did.startswith(b'did:'):
+        return False
+    return DID_PATTERN_BYTES.fullmatch(did) is not None
 
 
 def encode_ipfs_to_contenthash(ipfs_cid: str) -> str:
@@ -138,6 +262,12 @@ def encode_ipfs_to_contenthash(ipfs_cid: str) -> str:
     return '0x' + value
 
 
+# namehash("eth"), the parent node of every name this server handles
+ETH_NODE = keccak(b'\x00' * 32 + keccak(b'eth'))
+
+
+# Hot domains are looked up repeatedly, and a namehash never changes
+@functools.lru_cache(maxsize=4096)
 def ens_namehash(name: str) -> bytes:
     """
     Calculate the namehash for an ENS domain name.
@@ -151,244 +281,493 @@ def ens_namehash(name: str) -> bytes:
     if not name:
         return b'\x00' * 32
     
-    # Split the name into labels
-    labels = name.split('.')
-    
-    # Start with the zero hash
-    node = b'\x00' * 32
+    if name.endswith('.eth'):
+        # Every .eth name shares the same first step, so start from its node
+        labels = name[:-4].split('.')
+        node = ETH_NODE
+    else:
+        # Split the name into labels
+        labels = name.split('.')
+        # Start with the zero hash
+        node = b'\x00' * 32
     
     # Process labels in reverse order (right to left)
     for label in reversed(labels):
         # Hash the label
-        label_hash = Web3.keccak(text=label)
+        label_hash = keccak(label.encode('utf-8'))
         # Hash the concatenation of the previous node and label hash
-        # Convert both to hex strings, remove 0x prefix, concatenate, then hash
-        node_hex = Web3.to_hex(node)[2:]  # Remove '0x'
-        label_hex = Web3.to_hex(label_hash)[2:]  # Remove '0x'
-        combined = '0x' + node_hex + label_hex
-        node = Web3.keccak(hexstr=combined)
+        node = keccak(node + label_hash)
     
     return node
 
 
-def check_ens_domain_registered(domain: str) -> Optional[bool]:
+def ens_eth_call(to: str, data: bytes) -> bytes:
     """
-    Check if an ENS domain is registered by querying the ENS Registry contract.
+    Make a raw eth_call against the latest block and return its result.
     
-    Args:
-        domain: The ENS domain (e.g., "example.eth")
-    
-    Returns:
-        True if registered, False if not registered, None if check failed/unavailable
+    The request goes straight to the provider: web3's middleware would
+    otherwise validate each call with extra eth_chainId requests, which would
+    undo the round trips saved by batching lookups through Multicall3.
     """
-    if not ens_registry_contract or not web3_instance:
-        # RPC not configured or not available
-        return None
-    
-    try:
-        # Calculate namehash for the domain
-        node = ens_namehash(domain)
-        
-        # Call the owner() function on the registry contract
-        owner = ens_registry_contract.functions.owner(node).call()
-        
-        # If owner is zero address, domain is not registered
-        # Otherwise, it's registered (even if resolver/contenthash not set)
-        zero_address = '0x0000000000000000000000000000000000000000'
-        is_registered = owner.lower() != zero_address.lower()
-        return is_registered
-    except Exception as e:
-        # If there's an error, return None to indicate we couldn't check
-        print(f"Error checking ENS domain registration for {domain}: {e}")
-        return None
+    response = web3_instance.provider.make_request('eth_call', [{'to': to, 'data': '0x' + data.hex()}, 'latest'])
+    result = response.get('result')
+    if not isinstance(result, str):
+        raise Web3RPCError(f"eth_call to {to} failed: {response.get('error')}")
+    return bytes.fromhex(result.removeprefix('0x'))
 
 
-def check_ens_contenthash_exists(domain: str) -> Optional[bool]:
+def check_ens_status(domain: str) -> Tuple[Optional[bool], Optional[bool]]:
     """
-    Check if an ENS domain has a contenthash set by querying the resolver contract.
+    Check whether an ENS domain is registered and whether it has a contenthash set.
+    
+    The registry's owner() and resolver() are read together in one Multicall3
+    eth_call; the resolver's contenthash() is a second call, only made when a
+    resolver is set.
     
     Args:
         domain: The ENS domain (e.g., "example.eth")
     
     Returns:
-        True if contenthash exists, False if not set, None if check failed/unavailable
+        Tuple of (registered, contenthash_exists). Each is True or False, or None
+        if that check failed or RPC is not configured. contenthash_exists is only
+        False when the name's own resolver returned an empty contenthash; with no
+        resolver set it is None, as a wildcard resolver on a parent name (ENSIP-10)
+        may still answer for it.
     """
-    if not ens_registry_contract or not web3_instance:
+    if not web3_instance:
         # RPC not configured or not available
-        return None
+        return None, None
+    
+    # Calculate namehash for the domain
+    node = ens_namehash(domain)
+    
+    try:
+        # owner() and resolver() in a single round trip; allowFailure so one
+        # reverting call doesn't lose the other's answer
+        calldata = MULTICALL3_AGGREGATE3_SELECTOR + abi_encode(['(address,bool,bytes)[]'], [[
+            (ENS_REGISTRY_ADDRESS, True, ENS_OWNER_SELECTOR + node),
+            (ENS_REGISTRY_ADDRESS, True, ENS_RESOLVER_SELECTOR + node)
+        ]])
+        returned = ens_eth_call(MULTICALL3_ADDRESS, calldata)
+        (owner_ok, owner_data), (resolver_ok, resolver_data) = abi_decode(['(bool,bytes)[]'], returned)[0]
+    except ENS_CALL_ERRORS as e:
+        # If there's an error, return None to indicate we couldn't check
+        print(f"Error checking ENS registry for {domain}: {e}")
+        return None, None
+    
+    # An address is returned as a 32-byte word, left-padded with zeros
+    owner = Web3.to_checksum_address(owner_data[-20:]) if owner_ok and len(owner_data) == 32 else None
+    resolver_address = Web3.to_checksum_address(resolver_data[-20:]) if resolver_ok and len(resolver_data) == 32 else None
+    
+    # If owner is zero address, domain is not registered
+    # Otherwise, it's registered (even if resolver/contenthash not set)
+    is_registered = None if owner is None else owner != ZERO_ADDRESS
+    
+    if resolver_address is None or resolver_address == ZERO_ADDRESS:
+        return is_registered, None
     
     try:
-        # Calculate namehash for the domain
-        node = ens_namehash(domain)
-        
-        # Get the resolver address from the registry
-        resolver_address = ens_registry_contract.functions.resolver(node).call()
-        
-        zero_address = '0x0000000000000000000000000000000000000000'
-        if resolver_address.lower() == zero_address.lower():
-            # No resolver set, so no contenthash
-            return False
-        
-        # Create resolver contract instance
-        resolver_contract = web3_instance.eth.contract(
-            address=Web3.to_checksum_address(resolver_address),
-            abi=ENS_RESOLVER_ABI
-        )
-        
         # Query the contenthash
-        contenthash_bytes = resolver_contract.functions.contenthash(node).call()
-        
-        # If contenthash is empty (0x or empty bytes), it's not set
-        if not contenthash_bytes or contenthash_bytes == b'' or contenthash_bytes.hex() == '00':
-            return False
-        
-        # Contenthash exists
-        return True
-    except Exception as e:
+        returned = ens_eth_call(resolver_address, ENS_CONTENTHASH_SELECTOR + node)
+        contenthash_bytes = abi_decode(['bytes'], returned)[0]
+    except ENS_CALL_ERRORS as e:
         # If there's an error (e.g., resolver doesn't support contenthash), return None
         print(f"Error checking ENS contenthash for {domain}: {e}")
-        return None
+        return is_registered, None
+    
+    # If contenthash is empty (0x or empty bytes), it's not set
+    if not contenthash_bytes or contenthash_bytes.hex() == '00':
+        return is_registered, False
+    
+    # Contenthash exists
+    return is_registered, True
 
 
-async def query_eth_link_gateway(domain: str) -> Dict[str, Any]:
+def lookup_success(did: str) -> Dict[str, Any]:
+    """Build the result of a successful DID lookup."""
+    return {"success": True, "did": did, "error": None, "errorType": None}
+
+
+def lookup_error(error: str, error_type: str) -> Dict[str, Any]:
+    """Build the result of a failed DID lookup."""
+    return {"success": False, "did": None, "error": error, "errorType": error_type}
+
+
+class GatewayBusyError(Exception):
+    """No gateway slot freed up within GATEWAY_QUEUE_TIMEOUT.
+    
+    Raised rather than returned as a result so that this worker's own overload
+    is never cached as the domain's answer; see gateway_busy_error.
+    """
+
+
+def gateway_busy_error(domain: str) -> Dict[str, Any]:
+    """The lookup result reported for a GatewayBusyError; never cached."""
+    return lookup_error(f"Server is busy; could not query gateway for '{domain}'", "gateway_failure")
+
+
+async def _fetch_did_file(domain: str) -> Union[Dict[str, Any], int]:
     """
-    Query the .eth.link gateway (or test server in Sepolia mode) for the .well-known/atproto-did file.
+    Fetch and validate the .well-known/atproto-did file from the gateway (or test server in Sepolia mode).
     
     Args:
         domain: The ENS domain (e.g., "example.eth" or "bot.reality.eth")
     
     Returns:
-        Dict with 'success', 'did', 'error', and 'errorType' keys
-    """
-    # First, check if the domain is registered via ENS Registry (if available)
-    registration_status = check_ens_domain_registered(domain)
-    # Also check if contenthash exists
-    contenthash_exists = check_ens_contenthash_exists(domain)
+        Dict with 'success', 'did', 'error', and 'errorType' keys, or the HTTP
+        status the gateway answered with if it didn't serve the file. That
+        status is turned into an error by _gateway_status_error once the ENS
+        status is known.
     
+    Raises:
+        GatewayBusyError: If no gateway slot freed up in time
+    """
     # Use test server if Sepolia test mode is enabled
     if SEPOLIA_TEST_MODE and TEST_SERVER_URL:
         gateway_url = f"{TEST_SERVER_URL}/.well-known/atproto-did?ens={domain}"
     else:
-        # Construct the gateway URL
-        gateway_url = f"https://{domain}.link/.well-known/atproto-did/"
+        # Construct the gateway URL from the pre-parsed template; only the host changes
+        gateway_url = GATEWAY_URL_TEMPLATE.copy_with(host=f"{domain}.link")
     
     try:
-        # Make request with 10-second timeout
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(gateway_url)
-            
-            # Check if the domain exists (404 means gateway couldn't find it)
-            if response.status_code == 404:
-                # If we know the domain is registered and has a contenthash, but gateway returns 404,
-                # it means the contenthash points to content that doesn't have the .well-known/atproto-did file
-                if registration_status is True and contenthash_exists is True:
-                    return {
-                        "success": False,
-                        "did": None,
-                        "error": f"ENS domain '{domain}' is registered and has a contenthash set, but the content does not include a .well-known/atproto-did file. Please update the contenthash to point to content that includes this file.",
-                        "errorType": "no_did_file"
-                    }
-                # If domain is registered but no contenthash is set
-                elif registration_status is True and contenthash_exists is False:
-                    return {
-                        "success": False,
-                        "did": None,
-                        "error": f"ENS domain '{domain}' is registered but does not have a contenthash set. Please set the contenthash for this domain.",
-                        "errorType": "no_contenthash"
-                    }
-                # If we know it's not registered, return that
-                elif registration_status is False:
-                    return {
-                        "success": False,
-                        "did": None,
-                        "error": f"ENS domain '{domain}' is not registered",
-                        "errorType": "no_domain"
-                    }
-                # If we couldn't check registration, use the old behavior (assume not registered)
-                else:
-                    return {
-                        "success": False,
-                        "did": None,
-                        "error": f"ENS domain '{domain}' is not registered or does not have a .well-known/atproto-did file",
-                        "errorType": "no_domain"
-                    }
-            
-            # Check for other HTTP errors
-            if not response.is_success:
-                # If we know the domain is registered and has contenthash, provide more context
-                if registration_status is True and contenthash_exists is True:
-                    return {
-                        "success": False,
-                        "did": None,
-                        "error": f"ENS domain '{domain}' is registered and has a contenthash set, but gateway returned status {response.status_code}. The content may not include a .well-known/atproto-did file.",
-                        "errorType": "gateway_failure"
-                    }
-                # If domain is registered but no contenthash
-                elif registration_status is True and contenthash_exists is False:
-                    return {
-                        "success": False,
-                        "did": None,
-                        "error": f"ENS domain '{domain}' is registered but gateway returned status {response.status_code}. The domain may not have a contenthash set.",
-                        "errorType": "gateway_failure"
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "did": None,
-                        "error": f"Gateway returned status {response.status_code}",
-                        "errorType": "gateway_failure"
-                    }
-            
-            # Get the content
-            content = response.text.strip()
-            
-            # Check if content is empty
-            if not content:
-                return {
-                    "success": False,
-                    "did": None,
-                    "error": f"ENS domain '{domain}' exists but .well-known/atproto-did file is empty",
-                    "errorType": "invalid_did"
-                }
+        await asyncio.wait_for(gateway_semaphore.acquire(), timeout=GATEWAY_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise GatewayBusyError(domain)
+    
+    try:
+        # Make request with 10-second timeout on the shared pooled client.
+        # Stream the body so an oversized file is rejected without buffering it.
+        async with app.state.http_client.stream("GET", gateway_url) as response:
+            status = response.status_code
+            if 200 <= status < 300:
+                # Get the content, giving up as soon as it is too large to be a DID file
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+                    if len(body) > MAX_DID_FILE_SIZE:
+                        return lookup_error(
+                            f"ENS domain '{domain}' exists but .well-known/atproto-did file is larger than {MAX_DID_FILE_SIZE} bytes",
+                            "invalid_did"
+                        )
+                content = body.strip()
             
-            # Validate DID syntax
-            if not is_valid_did(content):
-                return {
-                    "success": False,
-                    "did": None,
-                    "error": f"ENS domain '{domain}' exists but .well-known/atproto-did content is not a valid DID: {content}",
-                    "errorType": "invalid_did"
-                }
+                # Check if content is empty
+                if not content:
+                    return lookup_error(
+                        f"ENS domain '{domain}' exists but .well-known/atproto-did file is empty",
+                        "invalid_did"
+                    )
             
-            # Success - return the DID
-            return {
-                "success": True,
-                "did": content,
-                "error": None,
-                "errorType": None
-            }
+                # Validate DID syntax on the raw bytes; a valid DID is plain ASCII,
+                # so only decode for the error message or once it has matched
+                if not is_valid_did_bytes(content):
+                    return lookup_error(
+                        f"ENS domain '{domain}' exists but .well-known/atproto-did content is not a valid DID: {content.decode('utf-8', errors='replace')}",
+                        "invalid_did"
+                    )
             
+                # Success - return the DID
+                return lookup_success(content.decode('ascii'))
     except httpx.TimeoutException:
-        return {
-            "success": False,
-            "did": None,
-            "error": f"Timeout while querying gateway for '{domain}'",
-            "errorType": "gateway_failure"
-        }
+        return lookup_error(f"Timeout while querying gateway for '{domain}'", "gateway_failure")
     except httpx.RequestError as e:
-        return {
-            "success": False,
-            "did": None,
-            "error": f"Failed to query gateway for '{domain}': {str(e)}",
-            "errorType": "gateway_failure"
-        }
+        return lookup_error(f"Failed to query gateway for '{domain}': {str(e)}", "gateway_failure")
+    finally:
+        gateway_semaphore.release()
+    
+    return status
+
+
+def _gateway_status_error(
+    domain: str,
+    status: int,
+    registration_status: Optional[bool],
+    contenthash_exists: Optional[bool]
+) -> Dict[str, Any]:
+    """Explain a gateway HTTP error for a domain, using what check_ens_status found."""
+    # Check if the domain exists (404 means gateway couldn't find it)
+    if status == 404:
+        # If we know the domain is registered and has a contenthash, but gateway returns 404,
+        # it means the contenthash points to content that doesn't have the .well-known/atproto-did file
+        if registration_status is True and contenthash_exists is True:
+            return lookup_error(
+                f"ENS domain '{domain}' is registered and has a contenthash set, but the content does not include a .well-known/atproto-did file. Please update the contenthash to point to content that includes this file.",
+                "no_did_file"
+            )
+        # If domain is registered but no contenthash is set
+        elif registration_status is True and contenthash_exists is False:
+            return lookup_error(
+                f"ENS domain '{domain}' is registered but does not have a contenthash set. Please set the contenthash for this domain.",
+                "no_contenthash"
+            )
+        # Registered, but with no resolver of its own or an unreadable contenthash
+        elif registration_status is True:
+            return lookup_error(
+                f"ENS domain '{domain}' is registered but the gateway found no content for it. The domain may not have a contenthash set.",
+                "no_contenthash"
+            )
+        # If we know it's not registered, return that
+        elif registration_status is False:
+            return lookup_error(f"ENS domain '{domain}' is not registered", "no_domain")
+        # If we couldn't check registration, use the old behavior (assume not registered)
+        else:
+            return lookup_error(
+                f"ENS domain '{domain}' is not registered or does not have a .well-known/atproto-did file",
+                "no_domain"
+            )
+    
+    # Other HTTP errors: if we know the domain is registered and has a contenthash,
+    # provide more context
+    if registration_status is True and contenthash_exists is True:
+        return lookup_error(
+            f"ENS domain '{domain}' is registered and has a contenthash set, but gateway returned status {status}. The content may not include a .well-known/atproto-did file.",
+            "gateway_failure"
+        )
+    # If domain is registered but no contenthash
+    elif registration_status is True and contenthash_exists is False:
+        return lookup_error(
+            f"ENS domain '{domain}' is registered but gateway returned status {status}. The domain may not have a contenthash set.",
+            "gateway_failure"
+        )
+    else:
+        return lookup_error(f"Gateway returned status {status}", "gateway_failure")
+
+
+async def fetch_from_eth_link_gateway(domain: str, probe_ens: bool = True) -> Dict[str, Any]:
+    """
+    Look up the ATProto DID for an ENS domain via its .well-known/atproto-did file.
+    
+    Args:
+        domain: The ENS domain (e.g., "example.eth" or "bot.reality.eth")
+        probe_ens: Whether to query ENS to explain a failed fetch. Without it,
+            error types are only as precise as the gateway response allows.
+    
+    Returns:
+        Dict with 'success', 'did', 'error', and 'errorType' keys
+    
+    Raises:
+        GatewayBusyError: If no gateway slot freed up in time
+    """
+    if not probe_ens:
+        fetched = await _fetch_did_file(domain)
+        return fetched if isinstance(fetched, dict) else _gateway_status_error(domain, fetched, None, None)
+    
+    # Check if the domain is registered and has a contenthash via ENS (if available),
+    # concurrently with the gateway request. The answer is only needed to explain a
+    # failed fetch, so on success it is never waited for.
+    # web3 calls block, so run them in a worker thread to keep the event loop free.
+    ens_task = asyncio.create_task(asyncio.to_thread(check_ens_status, domain))
+    gateway_task = asyncio.create_task(_fetch_did_file(domain))
+    try:
+        done, _ = await asyncio.wait({ens_task, gateway_task}, return_when=asyncio.FIRST_COMPLETED)
+        if gateway_task not in done:
+            registration_status, contenthash_exists = ens_task.result()
+            # A registered domain whose own resolver has an empty contenthash has
+            # no content for the gateway to serve, so don't wait for it to say so.
+            # A check that couldn't tell, or found no resolver, waits for the gateway.
+            # An unregistered name is not short-circuited: wildcard and offchain
+            # resolvers can serve subnames that have no owner in the registry.
+            if registration_status is True and contenthash_exists is False:
+                return lookup_error(
+                    f"ENS domain '{domain}' is registered but does not have a contenthash set. Please set the contenthash for this domain.",
+                    "no_contenthash"
+                )
+        fetched = await gateway_task
+        if isinstance(fetched, dict):
+            return fetched
+        # The gateway didn't serve the file; its stream is closed and its slot
+        # released, so wait on the ENS check without holding either
+        registration_status, contenthash_exists = await ens_task
+        return _gateway_status_error(domain, fetched, registration_status, contenthash_exists)
+    finally:
+        # Drop whichever of the two wasn't needed. An ENS check that failed
+        # after the gateway had already answered is marked as retrieved so it
+        # isn't reported as an unhandled task exception.
+        gateway_task.cancel()
+        if not ens_task.cancel() and not ens_task.cancelled():
+            ens_task.exception()
+
+
+# Cache of gateway lookups. ENS records change rarely, so hot domains are
+# answered without touching the gateway. By default this is an in-process dict
+# keyed by domain: (fresh_until, stale_until, result). When REDIS_URL is set the
+# cache lives in Redis instead, so all workers share it and see each other's
+# invalidations.
+DID_CACHE_TTL = int(os.getenv('DID_CACHE_TTL', '300'))  # seconds, for successful lookups
+# Seconds, for definite negative answers. Kept short by default because the
+# onboarding page polls a domain until its newly published DID shows up.
+DID_NEGATIVE_CACHE_TTL = int(os.getenv('DID_NEGATIVE_CACHE_TTL', '10'))
+NEGATIVE_ERROR_TYPES = frozenset({"no_domain", "no_contenthash", "no_did_file", "invalid_did"})
+# Seconds, for gateway failures. Just long enough that a struggling gateway
+# isn't hit by every poll, short enough that recovery is noticed quickly.
+DID_FAILURE_CACHE_TTL = int(os.getenv('DID_FAILURE_CACHE_TTL', '5'))
+# Seconds a success or definite negative answer may still be served after its
+# TTL (stale-while-revalidate): a read in this window returns the stale entry
+# at once and refreshes it in the background. Failures are never served stale.
+DID_CACHE_STALE_TTL = int(os.getenv('DID_CACHE_STALE_TTL', '600'))
+# Bound on in-process cache entries; the oldest entry is evicted when full
+DID_CACHE_MAX_ENTRIES = 10_000
+REDIS_CACHE_PREFIX = 'eth-did:'
+_did_cache: Dict[str, Tuple[float, float, Dict[str, Any]]] = {}
+_did_cache_refreshes: Dict[str, asyncio.Task] = {}
+# Gateway fetches currently in flight, so concurrent lookups of the same
+# domain share one upstream request instead of each issuing their own
+_inflight_lookups: Dict[str, asyncio.Task] = {}
+# Bumped each time a domain's entry is invalidated, so a lookup that started
+# before then doesn't write its answer back into the cache
+_did_cache_generations: Dict[str, int] = {}
+
+
+def _stale_ttl(result: Dict[str, Any]) -> int:
+    """How long past its TTL a cached result may be served while it is refreshed."""
+    if result["success"] or result["errorType"] in NEGATIVE_ERROR_TYPES:
+        return DID_CACHE_STALE_TTL
+    return 0
+
+
+def _schedule_refresh(domain: str) -> None:
+    if domain not in _did_cache_refreshes:
+        _did_cache_refreshes[domain] = asyncio.create_task(_refresh_cached_did(domain))
+
+
+async def get_cached_did(domain: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the cached gateway result for a domain, or None if there isn't a usable one.
+    
+    A stale result is still returned, and a background refresh is started for it.
+    """
+    if redis_client:
+        try:
+            # Fetch the remaining lifetime along with the value, in one round trip
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.get(REDIS_CACHE_PREFIX + domain)
+            pipe.ttl(REDIS_CACHE_PREFIX + domain)
+            cached, remaining = await pipe.execute()
+        except RedisError as e:
+            print(f"Error reading cached DID for {domain} from Redis: {e}")
+            return None
+        if not cached:
+            return None
+        result = orjson.loads(cached)
+        # Keys live for TTL + stale TTL, so once fewer seconds than the stale TTL remain the entry is stale.
+        # TTL is -2 if the key expired between the two commands
+        if 0 <= remaining <= _stale_ttl(result):
+            _schedule_refresh(domain)
+        return result
+    
+    cached = _did_cache.get(domain)
+    if not cached:
+        return None
+    fresh_until, stale_until, result = cached
+    now = time.monotonic()
+    if now >= stale_until:
+        _did_cache.pop(domain, None)
+        return None
+    if now >= fresh_until:
+        _schedule_refresh(domain)
+    return result
+
+
+async def cache_gateway_result(domain: str, result: Dict[str, Any]) -> None:
+    """Store a gateway result in the cache, for a TTL that depends on the kind of result."""
+    if result["success"]:
+        ttl = DID_CACHE_TTL
+    elif result["errorType"] in NEGATIVE_ERROR_TYPES:
+        ttl = DID_NEGATIVE_CACHE_TTL
+    else:
+        ttl = DID_FAILURE_CACHE_TTL
+    if ttl <= 0:
+        return
+    stale_ttl = _stale_ttl(result)
+    
+    if redis_client:
+        try:
+            await redis_client.set(REDIS_CACHE_PREFIX + domain, orjson.dumps(result), ex=ttl + stale_ttl)
+        except RedisError as e:
+            print(f"Error writing cached DID for {domain} to Redis: {e}")
+    else:
+        # Re-insert so dict order tracks write time; the first key is then the oldest
+        _did_cache.pop(domain, None)
+        if len(_did_cache) >= DID_CACHE_MAX_ENTRIES:
+            del _did_cache[next(iter(_did_cache))]
+        now = time.monotonic()
+        _did_cache[domain] = (now + ttl, now + ttl + stale_ttl, result)
+
+
+async def invalidate_cached_did(domain: str) -> None:
+    """Drop any cached gateway result for a domain, and stop lookups already in flight from re-caching it."""
+    # A lookup or refresh started before the change could otherwise re-cache the
+    # old answer. Later lookups start a fresh fetch rather than joining one of those.
+    _did_cache_generations[domain] = _did_cache_generations.get(domain, 0) + 1
+    _inflight_lookups.pop(domain, None)
+    refresh = _did_cache_refreshes.pop(domain, None)
+    if refresh:
+        refresh.cancel()
+    if redis_client:
+        try:
+            await redis_client.delete(REDIS_CACHE_PREFIX + domain)
+        except RedisError as e:
+            print(f"Error deleting cached DID for {domain} from Redis: {e}")
+    else:
+        _did_cache.pop(domain, None)
+
+
+async def _fetch_and_cache(domain: str) -> Dict[str, Any]:
+    generation = _did_cache_generations.get(domain, 0)
+    try:
+        result = await fetch_from_eth_link_gateway(domain)
+    except GatewayBusyError:
+        return gateway_busy_error(domain)
+    if _did_cache_generations.get(domain, 0) == generation:
+        await cache_gateway_result(domain, result)
+    return result
+
+
+async def _refresh_cached_did(domain: str) -> None:
+    try:
+        result = await fetch_from_eth_link_gateway(domain)
+        # If the gateway is failing, keep serving the stale answer until it
+        # runs out rather than replacing it with the failure
+        if result["success"] or result["errorType"] in NEGATIVE_ERROR_TYPES:
+            await cache_gateway_result(domain, result)
+    except GatewayBusyError:
+        # Keep serving the stale answer; a later read will try again
+        pass
     except Exception as e:
-        return {
-            "success": False,
-            "did": None,
-            "error": f"Unexpected error: {str(e)}",
-            "errorType": "gateway_failure"
-        }
+        print(f"Error refreshing cached DID for {domain}: {e}")
+    finally:
+        # Only clear our own entry; if this refresh was cancelled, a newer one may have replaced it
+        if _did_cache_refreshes.get(domain) is asyncio.current_task():
+            del _did_cache_refreshes[domain]
+
+
+def _forget_inflight_lookup(domain: str, task: asyncio.Task) -> None:
+    # Only clear our own entry; an invalidation may have let a newer lookup replace it
+    if _inflight_lookups.get(domain) is task:
+        del _inflight_lookups[domain]
+
+
+async def query_eth_link_gateway(domain: str) -> Dict[str, Any]:
+    """
+    Get the gateway result for a domain, answering from the cache when possible.
+    
+    Args:
+        domain: The ENS domain (e.g., "example.eth" or "bot.reality.eth")
+    
+    Returns:
+        Dict with 'success', 'did', 'error', and 'errorType' keys
+    """
+    cached = await get_cached_did(domain)
+    if cached is not None:
+        return cached
+    
+    task = _inflight_lookups.get(domain)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_cache(domain))
+        _inflight_lookups[domain] = task
+        task.add_done_callback(lambda done: _forget_inflight_lookup(domain, done))
+    # Shielded so one caller going away doesn't cancel the fetch for the others
+    return await asyncio.shield(task)
 
 
 @app.get("/")
@@ -452,7 +831,7 @@ async def serve_client_metadata(request: Request):
     # exact URL this is served from. No client secret (public client using
     # PKCE + DPoP instead), so token_endpoint_auth_method is "none".
     base = str(request.base_url).rstrip("/")
-    return JSONResponse(_client_metadata_document(f"{base}/client-metadata.json", base))
+    return ORJSONResponse(_client_metadata_document(f"{base}/client-metadata.json", base))
 
 
 @app.get("/client-metadata/{tag}.json")
@@ -461,43 +840,138 @@ async def serve_client_metadata_tagged(request: Request, tag: str):
     # is requested. Exists so a fresh client_id can be picked during testing
     # without waiting out an authorization server's cache of the untagged one.
     base = str(request.base_url).rstrip("/")
-    return JSONResponse(_client_metadata_document(f"{base}/client-metadata/{tag}.json", base))
+    return ORJSONResponse(_client_metadata_document(f"{base}/client-metadata/{tag}.json", base))
+
+
+# Cache-Control values for GET lookups
+SUCCESS_CACHE_CONTROL = "public, max-age=60, s-maxage=300, stale-while-revalidate=600"
+# Negative answers may turn positive once a DID file is published, so clients
+# hold them no longer than the server-side cache does
+NEGATIVE_CACHE_CONTROL = f"public, max-age={DID_NEGATIVE_CACHE_TTL}"
+
+
+def did_etag(did: str) -> str:
+    """Strong ETag for a successful lookup; the response body is a function of the DID alone."""
+    return '"' + hashlib.blake2s(did.encode('ascii'), digest_size=8).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag (weak comparison, per RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
 
 
 @app.get("/atproto-did/{domain}")
-async def get_atproto_did(domain: str) -> JSONResponse:
+async def get_atproto_did(domain: str, request: Request) -> Response:
     """
     Get the ATProto DID from an ENS domain's .well-known/atproto-did file.
     
     Args:
         domain: The ENS domain (e.g., "example.eth" or "bot.reality.eth")
+        request: The incoming request, checked for If-None-Match
     
     Returns:
-        JSON response with success status, DID, and error information
+        JSON response with success status, DID, and error information,
+        or an empty 304 if the client already has the current DID
     """
-    # Validate domain format (should end with .eth)
-    if not domain.endswith('.eth'):
-        raise HTTPException(
-            status_code=400,
-            detail="Domain must end with .eth"
-        )
+    # Validate domain format (should be a well-formed .eth name)
+    if not is_valid_ens_domain(domain):
+        return Response(content=INVALID_DOMAIN_BODY, status_code=400, media_type="application/json")
     
     # Query the gateway
     result = await query_eth_link_gateway(domain)
     
+    # Let browsers and CDNs absorb repeat lookups: successes change rarely,
+    # negative answers may flip as soon as the owner sets things up, and
+    # gateway failures should be retried rather than remembered
+    if result["success"]:
+        headers = {"Cache-Control": SUCCESS_CACHE_CONTROL, "ETag": did_etag(result["did"])}
+        # The client's copy is still current, so skip sending the body again
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+    elif result["errorType"] == "gateway_failure":
+        headers = {"Cache-Control": "no-store"}
+    else:
+        headers = {"Cache-Control": NEGATIVE_CACHE_CONTROL}
+    
     # Return appropriate HTTP status based on result
     if result["success"]:
-        return JSONResponse(content=result, status_code=200)
+        return ORJSONResponse(content=result, status_code=200, headers=headers)
     else:
         # Return 200 with error info in JSON (not HTTP error)
         # This allows the client to handle different error types
-        return JSONResponse(content=result, status_code=200)
+        return ORJSONResponse(content=result, status_code=200, headers=headers)
 
 
-# Request model for POST endpoint
+# Upper bound on domains per batch, and on lookups a single batch runs at once
+BATCH_MAX_DOMAINS = 100
+BATCH_CONCURRENCY = 50
+
+
+# Request model for batch lookup endpoint. The domain count is capped while
+# parsing, so an oversized body is rejected before its list is validated.
+class BatchDidRequest(BaseModel):
+    model_config = ConfigDict(strict=True, extra='forbid')
+    
+    domains: List[str] = Field(max_length=BATCH_MAX_DOMAINS)
+
+
+@app.post("/atproto-did:batch")
+async def get_atproto_dids_batch(request: BatchDidRequest) -> ORJSONResponse:
+    """
+    Get the ATProto DIDs for several ENS domains in one call.
+    
+    Lookups run concurrently on the shared HTTP client, so N domains cost
+    roughly one gateway round trip instead of N sequential ones.
+    
+    Args:
+        request: Request body with 'domains' list
+    
+    Returns:
+        JSON response with a 'results' list in the same order as 'domains'
+    """
+    invalid_domains = [d for d in request.domains if not is_valid_ens_domain(d)]
+    if invalid_domains:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Domains must be valid .eth names: {', '.join(invalid_domains)}"
+        )
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def lookup(domain: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await query_eth_link_gateway(domain)
+    
+    results = await asyncio.gather(
+        *(lookup(d) for d in request.domains),
+        return_exceptions=True
+    )
+    
+    return ORJSONResponse(content={
+        "results": [
+            {"domain": domain, **result} if not isinstance(result, BaseException)
+            else {"domain": domain, **lookup_error(f"Unexpected error: {str(result)}", "gateway_failure")}
+            for domain, result in zip(request.domains, results)
+        ]
+    })
+
+
+# Request model for POST endpoint. Length limits and whitespace stripping are
+# applied by pydantic-core while parsing; DID syntax is still checked by the
+# handler so it can answer with the documented invalid_did error.
 class CreateDidRequest(BaseModel):
-    domain: str
-    did: str
+    # Strict mode skips pydantic's type coercion and rejects anything that
+    # isn't already the right JSON type; unknown fields are rejected too
+    model_config = ConfigDict(str_strip_whitespace=True, strict=True, extra='forbid')
+    
+    domain: str = Field(max_length=MAX_DOMAIN_LENGTH)
+    did: str = Field(max_length=MAX_DID_LENGTH)
+    # Pin without first checking the gateway for an existing DID file
+    force: bool = False
 
 
 async def check_existing_did(domain: str, expected_did: str) -> Dict[str, Any]:
@@ -511,7 +985,23 @@ async def check_existing_did(domain: str, expected_did: str) -> Dict[str, Any]:
     Returns:
         Dict with 'exists' and 'matches' keys
     """
-    result = await query_eth_link_gateway(domain)
+    # Use a cached or in-flight full lookup if there is one. Otherwise fetch
+    # without the ENS RPC calls: only whether a DID exists matters here.
+    result = await get_cached_did(domain)
+    if result is None:
+        inflight = _inflight_lookups.get(domain)
+        if inflight:
+            result = await asyncio.shield(inflight)
+        else:
+            generation = _did_cache_generations.get(domain, 0)
+            try:
+                result = await fetch_from_eth_link_gateway(domain, probe_ens=False)
+            except GatewayBusyError:
+                result = gateway_busy_error(domain)
+            # Error types are vague without the ENS checks, so only a
+            # success is complete enough to share with GET lookups
+            if result["success"] and _did_cache_generations.get(domain, 0) == generation:
+                await cache_gateway_result(domain, result)
     
     if result["success"]:
         return {
@@ -534,104 +1024,140 @@ async def check_existing_did(domain: str, expected_did: str) -> Dict[str, Any]:
         }
 
 
-async def pin_to_filebase(domain: str, did: str) -> Dict[str, Any]:
+# Local IPFS (Kubo) RPC API. Adding through the shared HTTP client reuses a
+# keep-alive connection instead of forking the ipfs CLI for every pin.
+IPFS_API_URL = os.getenv('IPFS_API_URL', 'http://127.0.0.1:5001').rstrip('/')
+IPFS_ADD_TIMEOUT = 10.0
+EMPTY_DIRECTORY_HASH = 'QmUNLLsPACCz1vLxQVkXqqLX5R1X345qqfHbsf67hvA3Nn'
+
+# Cap on concurrent local adds, so a burst of POSTs can't swamp the IPFS daemon
+IPFS_MAX_CONCURRENCY = int(os.getenv('IPFS_MAX_CONCURRENCY', '8'))
+ipfs_semaphore = asyncio.Semaphore(IPFS_MAX_CONCURRENCY)
+
+
+def _ipfs_add_parts(domain: str, file_content: bytes) -> List[Tuple[str, Tuple[str, bytes, str]]]:
     """
-    Create and pin a .well-known/atproto-did file to local IPFS and Filebase.
-    Pins locally first to get the hash, then also pins to Filebase for redundancy.
-    Only errors if both local and Filebase pinning fail.
+    Build the multipart parts for a <domain>/.well-known/atproto-did directory tree.
+    
+    Kubo takes the path from each part's filename, URL-encoded, with directories
+    sent as empty application/x-directory parts ahead of their contents.
+    """
+    def part(path: str, content: bytes, content_type: str) -> Tuple[str, Tuple[str, bytes, str]]:
+        return ('file', (quote(path, safe=''), content, content_type))
+    
+    return [
+        part(domain, b'', 'application/x-directory'),
+        part(f"{domain}/.well-known", b'', 'application/x-directory'),
+        part(f"{domain}/.well-known/atproto-did", file_content, 'application/octet-stream'),
+    ]
+
+
+async def pin_to_local_ipfs(domain: str, file_content: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Pin a <domain>/.well-known/atproto-did directory to the local IPFS node.
     
     Args:
         domain: The ENS domain
-        did: The DID to store
+        file_content: Contents of the atproto-did file
     
     Returns:
-        Dict with 'success', 'ipfs_hash', and 'error' keys
+        Tuple of (directory_hash, error); exactly one of them is None
     """
-    # Create file content (just the DID string)
-    file_content = did.encode('utf-8')
+    add_url = f"{IPFS_API_URL}/api/v0/add"
+    try:
+        async with ipfs_semaphore:
+            response = await app.state.http_client.post(
+                add_url,
+                params={'quieter': 'true', 'pin': 'true'},
+                files=_ipfs_add_parts(domain, file_content),
+                timeout=IPFS_ADD_TIMEOUT
+            )
+    except httpx.TimeoutException:
+        return None, f"ipfs add timed out after {IPFS_ADD_TIMEOUT:g} seconds"
+    except httpx.ConnectError:
+        return None, f"Could not reach the IPFS daemon at {IPFS_API_URL}. Please install and start IPFS from https://ipfs.io"
+    except httpx.RequestError as e:
+        return None, f"IPFS API request error: {str(e)}"
     
-    # Step 1: Pin to local IPFS first and get the directory hash
-    directory_hash = None
-    local_ipfs_error = None
-    filebase_error = None
+    if not response.is_success:
+        return None, f"ipfs add failed (HTTP {response.status_code}): {response.text.strip()}"
     
+    # The response is newline-delimited JSON; with quieter=true the last
+    # entry is the root directory
+    lines = response.content.strip().splitlines()
     try:
-        # Create a temporary directory structure
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Create the domain directory
-            domain_dir = os.path.join(temp_dir, domain)
-            os.makedirs(domain_dir, exist_ok=True)
-            
-            # Create the .well-known directory
-            well_known_dir = os.path.join(domain_dir, '.well-known')
-            os.makedirs(well_known_dir, exist_ok=True)
-            
-            # Write the DID file
-            did_file = os.path.join(well_known_dir, 'atproto-did')
-            with open(did_file, 'wb') as f:
-                f.write(file_content)
-                f.flush()
-                os.fsync(f.fileno())  # Ensure file is written to disk
-            
-            # Verify the file exists and has content before adding to IPFS
-            # Also verify the directory structure is correct
-            if not os.path.exists(did_file):
-                local_ipfs_error = f"File was not created: {did_file}"
-            elif os.path.getsize(did_file) == 0:
-                local_ipfs_error = f"File is empty: {did_file}"
-            elif os.path.getsize(did_file) != len(file_content):
-                local_ipfs_error = f"File size mismatch: expected {len(file_content)}, got {os.path.getsize(did_file)}"
-            elif not os.path.exists(well_known_dir):
-                local_ipfs_error = f".well-known directory does not exist: {well_known_dir}"
-            elif 'atproto-did' not in os.listdir(well_known_dir):
-                local_ipfs_error = f"File not found in .well-known directory. Contents: {os.listdir(well_known_dir)}"
-            else:
-                # Pin to local IPFS and get the directory hash using subprocess
-                # Use -H flag to include hidden directories (dotfiles)
-                try:
-                    import subprocess
-                    result = subprocess.run(
-                        ['ipfs', 'add', '-r', '-H', '-Q', domain_dir],
-                        capture_output=True,
-                        text=True,
-                        timeout=10
-                    )
-                    if result.returncode == 0:
-                        directory_hash = result.stdout.strip()
-                        # Verify we got a valid hash and it's not the empty directory hash
-                        if directory_hash == 'QmUNLLsPACCz1vLxQVkXqqLX5R1X345qqfHbsf67hvA3Nn':
-                            # This is the empty directory hash - the file wasn't included properly
-                            local_ipfs_error = f"IPFS returned empty directory hash. Check directory: {domain_dir}"
-                            directory_hash = None
-                    else:
-                        local_ipfs_error = f"ipfs command failed: {result.stderr}"
-                except FileNotFoundError:
-                    local_ipfs_error = "ipfs command not found. Please install IPFS from https://ipfs.io"
-                except Exception as e:
-                    local_ipfs_error = f"Subprocess IPFS error: {str(e)}"
+        directory_hash = orjson.loads(lines[-1]).get('Hash') if lines else None
+    except orjson.JSONDecodeError:
+        directory_hash = None
     
-    except Exception as e:
-        local_ipfs_error = f"Local IPFS pinning error: {str(e)}"
+    if not directory_hash:
+        return None, f"Could not parse ipfs add response: {response.text.strip()}"
+    if directory_hash == EMPTY_DIRECTORY_HASH:
+        # This is the empty directory hash - the file wasn't included properly
+        return None, f"IPFS returned empty directory hash for {domain}"
     
-    # Step 2: Also pin to Filebase (but don't fail if this fails)
-    if s3_client:
-        try:
-            # Create the file path (e.g., "example.eth/.well-known/atproto-did")
-            file_path = f"{domain}/.well-known/atproto-did"
-            
-            # Upload to Filebase (this automatically pins to IPFS)
-            s3_client.put_object(
+    return directory_hash, None
+
+
+async def upload_to_filebase(domain: str, file_content: bytes) -> Optional[str]:
+    """
+    Upload the .well-known/atproto-did file for a domain to Filebase, which pins it to IPFS.
+    
+    Args:
+        domain: The ENS domain
+        file_content: Contents of the atproto-did file
+    
+    Returns:
+        Error message, or None if the upload succeeded
+    """
+    if not s3_client:
+        return "Filebase not configured. Please set FILEBASE_ACCESS_KEY and FILEBASE_SECRET_KEY in .env"
+    
+    try:
+        # Create the file path (e.g., "example.eth/.well-known/atproto-did")
+        file_path = f"{domain}/.well-known/atproto-did"
+        
+        # Upload to Filebase (this automatically pins to IPFS).
+        # boto3 is blocking, so run it on the S3 thread pool.
+        await asyncio.get_running_loop().run_in_executor(
+            app.state.s3_executor,
+            functools.partial(
+                s3_client.put_object,
                 Bucket=FILEBASE_BUCKET,
                 Key=file_path,
                 Body=file_content,
                 ContentType='text/plain'
             )
-        except Exception as e:
-            filebase_error = f"Filebase pinning error: {str(e)}"
-    else:
-        filebase_error = "Filebase not configured. Please set FILEBASE_ACCESS_KEY and FILEBASE_SECRET_KEY in .env"
+        )
+    except (BotoCoreError, ClientError) as e:
+        return f"Filebase pinning error: {str(e)}"
     
-    # Step 3: Return result - only error if both failed
+    return None
+
+
+async def pin_to_filebase(domain: str, did: str) -> Dict[str, Any]:
+    """
+    Create and pin a .well-known/atproto-did file to local IPFS and Filebase.
+    Both pins run concurrently; the hash comes from the local pin and Filebase
+    provides redundancy. Only errors if both local and Filebase pinning fail.
+    
+    Args:
+        domain: The ENS domain
+        did: The DID to store
+    
+    Returns:
+        Dict with 'success', 'ipfs_hash', and 'error' keys
+    """
+    # Create file content (just the DID string)
+    file_content = did.encode('utf-8')
+    
+    # Neither pin depends on the other, so total latency is the slower of the two
+    (directory_hash, local_ipfs_error), filebase_error = await asyncio.gather(
+        pin_to_local_ipfs(domain, file_content),
+        upload_to_filebase(domain, file_content)
+    )
+    
+    # Return result - only error if both failed
     if directory_hash:
         # Success - we got the hash from local IPFS
         return {
@@ -655,34 +1181,28 @@ async def pin_to_filebase(domain: str, did: str) -> Dict[str, Any]:
 
 
 @app.post("/atproto-did/{domain}")
-async def create_atproto_did(domain: str, request: CreateDidRequest) -> JSONResponse:
+async def create_atproto_did(domain: str, request: CreateDidRequest) -> Response:
     """
     Create and pin a .well-known/atproto-did file for an ENS domain.
     
     Args:
         domain: The ENS domain (e.g., "example.eth" or "bot.reality.eth")
-        request: Request body with 'did' field
+        request: Request body with 'domain', 'did' and optional 'force' fields
     
     Returns:
         JSON response with success status, IPFS hash, and error information
     """
-    # Validate domain format (should end with .eth)
-    if not domain.endswith('.eth'):
-        raise HTTPException(
-            status_code=400,
-            detail="Domain must end with .eth"
-        )
+    # Validate domain format (should be a well-formed .eth name)
+    if not is_valid_ens_domain(domain):
+        return Response(content=INVALID_DOMAIN_BODY, status_code=400, media_type="application/json")
     
     # Validate request domain matches path parameter
     if request.domain != domain:
-        raise HTTPException(
-            status_code=400,
-            detail="Domain in request body must match path parameter"
-        )
+        return Response(content=DOMAIN_MISMATCH_BODY, status_code=400, media_type="application/json")
     
     # Validate DID format
     if not is_valid_did(request.did):
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "success": False,
                 "ipfs_hash": None,
@@ -692,12 +1212,12 @@ async def create_atproto_did(domain: str, request: CreateDidRequest) -> JSONResp
             status_code=400
         )
     
-    # Check if file already exists
-    existing_check = await check_existing_did(domain, request.did)
+    # Check if file already exists, unless the client asked to pin regardless
+    existing_check = {"exists": False} if request.force else await check_existing_did(domain, request.did)
     
     if existing_check["exists"]:
         if existing_check["matches"]:
-            return JSONResponse(
+            return ORJSONResponse(
                 content={
                     "success": False,
                     "ipfs_hash": None,
@@ -707,7 +1227,7 @@ async def create_atproto_did(domain: str, request: CreateDidRequest) -> JSONResp
                 status_code=200
             )
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 content={
                     "success": False,
                     "ipfs_hash": None,
@@ -721,11 +1241,14 @@ async def create_atproto_did(domain: str, request: CreateDidRequest) -> JSONResp
     pin_result = await pin_to_filebase(domain, request.did)
     
     if pin_result["success"]:
+        # The domain's DID is about to change, so stop serving the old lookup
+        await invalidate_cached_did(domain)
+        
         # Encode IPFS hash to contenthash format
         try:
             contenthash = encode_ipfs_to_contenthash(pin_result["ipfs_hash"])
-        except Exception as e:
-            return JSONResponse(
+        except (ValueError, KeyError) as e:
+            return ORJSONResponse(
                 content={
                     "success": False,
                     "ipfs_hash": pin_result["ipfs_hash"],
@@ -736,7 +1259,7 @@ async def create_atproto_did(domain: str, request: CreateDidRequest) -> JSONResp
                 status_code=500
             )
         
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "success": True,
                 "ipfs_hash": pin_result["ipfs_hash"],
@@ -747,7 +1270,7 @@ async def create_atproto_did(domain: str, request: CreateDidRequest) -> JSONResp
             status_code=200
         )
     else:
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "success": False,
                 "ipfs_hash": None,
@@ -766,4 +1289,18 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=38000)
+    # Run several worker processes so a single event loop doesn't cap throughput.
+    # Each worker has its own HTTP client and lookup cache.
+    # uvicorn[standard] installs uvloop and httptools, which uvicorn's default
+    # "auto" loop/http settings pick up; they are only left implicit so the
+    # server still starts where uvloop isn't available (e.g. Windows).
+    uvicorn.run(
+        "eth_server:app",
+        host="127.0.0.1",
+        port=38000,
+        workers=int(os.getenv('WEB_CONCURRENCY', '4')),
+        backlog=2048,
+        timeout_keep_alive=30,
+        # Per-request access logging costs more than many of the requests themselves
+        access_log=False
+    )